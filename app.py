@@ -1,9 +1,20 @@
 import streamlit as st
 import plotly.express as px
 import plotly.graph_objects as go  # Добавлен импорт
+from plotly_resampler import FigureResampler
 import numpy as np
 import pandas as pd
 import json
+import math
+import os
+from operator import itemgetter
+from pathlib import Path
+from scipy.optimize import brentq
+
+# Постоянный каталог кэша Numba рядом с приложением (задаётся до импорта numba),
+# чтобы скомпилированные ядра переживали перезапуск процесса и контейнера
+os.environ.setdefault("NUMBA_CACHE_DIR", str(Path(__file__).with_name(".numba_cache")))
+from financial_kernels import calc_financials_kernel, compute_income, compute_non_rental_expenses, project_kernel
 
 # Настройка страницы Streamlit с использованием предустановленной темы
 st.set_page_config(
@@ -36,6 +47,126 @@ storage_type_mapping = {
     'short_term_share': 'Краткосрочное хранение'
 }
 
+# Ключи долей всех типов хранения
+ALL_SHARE_KEYS = ("storage_share", "loan_share", "vip_share", "short_term_share")
+
+# Типы хранения в едином порядке для векторных (по одному элементу на тип) расчётов
+STORAGE_TYPES = ("storage", "loan", "vip", "short_term")
+STORAGE_TYPE_NAMES = tuple(storage_type_mapping[f"{t}_share"] for t in STORAGE_TYPES)
+_AREAS = itemgetter(*(f"{t}_area" for t in STORAGE_TYPES))
+_DENSITIES = itemgetter(*(f"{t}_items_density" for t in STORAGE_TYPES))
+_TYPE_INCOMES = itemgetter("storage_income", "loan_income_after_realization", "vip_income", "short_term_income")
+
+# Параметры, которые принимает calculate_financials (в порядке её сигнатуры)
+FINANCIALS_ARGS = (
+    "storage_area",
+    "loan_area",
+    "vip_area",
+    "short_term_area",
+    "storage_items_density",
+    "loan_items_density",
+    "vip_items_density",
+    "short_term_items_density",
+    "storage_fee",
+    "item_evaluation",
+    "item_realization_markup",
+    "average_item_value",
+    "loan_interest_rate",
+    "realization_share_storage",
+    "realization_share_loan",
+    "realization_share_vip",
+    "realization_share_short_term",
+    "rental_cost_per_m2",
+    "total_area",
+    "salary_expense",
+    "miscellaneous_expenses",
+    "depreciation_expense",
+    "default_probability",
+    "vip_extra_fee",
+    "short_term_daily_rate"
+)
+FINANCIALS_KEYS = frozenset(FINANCIALS_ARGS)
+
+# Извлечение аргументов из словаря параметров одним вызовом (порядок позиционных аргументов)
+_FIN_ARGS = itemgetter(*FINANCIALS_ARGS)
+_INCOME_ARGS = itemgetter(*(key for key in FINANCIALS_ARGS if key not in (
+    "rental_cost_per_m2", "total_area", "salary_expense", "miscellaneous_expenses", "depreciation_expense"
+)))
+
+# Заранее сформированные сообщения об ошибке диапазона долей
+share_range_errors = {
+    share_key: f"Доля {storage_type} должна быть между 0 и 1."
+    for share_key, storage_type in storage_type_mapping.items()
+}
+
+# Варианты дневного тарифа краткосрочного хранения
+SHORT_TERM_RATE_OPTIONS = ("50 руб./день/м²", "60 руб./день/м²", "100 руб./день/м²", "Другое (ввести вручную)")
+
+# Значения виджетов боковой панели по умолчанию (в единицах виджета, например проценты).
+# Задаются через session_state, а не параметром value=, чтобы загрузка сценария
+# могла записывать значения виджетов через Session State API
+WIDGET_DEFAULTS = {
+    "total_area": 250,
+    "rental_cost_per_m2": 1000,
+    "useful_area_ratio": 50,
+    "storage_fee": 1500,
+    "shelves_per_m2": 3,
+    "short_term_rate_choice": SHORT_TERM_RATE_OPTIONS[0],
+    "short_term_daily_rate": 60.0,
+    "item_evaluation": 80,
+    "item_realization_markup": 20,
+    "average_item_value": 10000,
+    "loan_interest_rate": 0.317,
+    "storage_items_density": 5,
+    "loan_items_density": 5,
+    "vip_items_density": 2,
+    "short_term_items_density": 4,
+    "realization_share_storage": 50,
+    "realization_share_loan": 50,
+    "realization_share_vip": 50,
+    "realization_share_short_term": 50,
+    "salary_expense": 240000,
+    "miscellaneous_expenses": 50000,
+    "depreciation_expense": 20000,
+    "time_horizon": 6,
+    "monthly_rent_growth": 1.0,
+    "default_probability": 5.0,
+    "liquidity_factor": 1.0,
+    "safety_factor": 1.2,
+}
+
+# Параметры сценария, которые задаются виджетами боковой панели.
+# Ключ виджета совпадает с ключом params; значение — (множитель params -> виджет,
+# целочисленный ли виджет, границы слайдера или None)
+SCENARIO_WIDGETS = {
+    "total_area": (1, True, None),
+    "rental_cost_per_m2": (1, True, None),
+    "useful_area_ratio": (100, True, (40, 80)),
+    "storage_fee": (1, True, None),
+    "shelves_per_m2": (1, True, None),
+    "item_evaluation": (100, True, (0, 100)),
+    "item_realization_markup": (1, True, None),
+    "average_item_value": (1, True, None),
+    "loan_interest_rate": (1, False, None),
+    "storage_items_density": (1, True, None),
+    "loan_items_density": (1, True, None),
+    "vip_items_density": (1, True, None),
+    "short_term_items_density": (1, True, None),
+    "realization_share_storage": (100, True, (0, 100)),
+    "realization_share_loan": (100, True, (0, 100)),
+    "realization_share_vip": (100, True, (0, 100)),
+    "realization_share_short_term": (100, True, (0, 100)),
+    "salary_expense": (1, True, None),
+    "miscellaneous_expenses": (1, True, None),
+    "depreciation_expense": (1, True, None),
+    "time_horizon": (1, True, (1, 24)),
+    "monthly_rent_growth": (100, False, None),
+    "default_probability": (100, False, None),
+    "liquidity_factor": (1, False, None),
+    "safety_factor": (1, False, None),
+    "vip_extra_fee": (1, False, None),  # Виджета нет, значение хранится в session_state
+}
+
 # Функция проверки входных данных
 def validate_inputs(params: dict) -> bool:
     errors = []
@@ -49,15 +180,19 @@ def validate_inputs(params: dict) -> bool:
         errors.append("Тариф простого хранения не может быть отрицательным.")
     if not (0 <= params["useful_area_ratio"] <= 1):
         errors.append("Доля полезной площади должна быть между 0% и 100%.")
-    for share_key, share_value in [
-        ("storage_share", params["storage_share"]),
-        ("loan_share", params["loan_share"]),
-        ("vip_share", params["vip_share"]),
-        ("short_term_share", params["short_term_share"])
-    ]:
-        if not (0 <= share_value <= 1):
-            errors.append(f"Доля {storage_type_mapping.get(share_key, share_key.replace('_', ' ').capitalize())} должна быть между 0 и 1.")
-    total_shares = params["storage_share"] + params["loan_share"] + params["vip_share"] + params["short_term_share"]
+    storage_share = params["storage_share"]
+    loan_share = params["loan_share"]
+    vip_share = params["vip_share"]
+    short_term_share = params["short_term_share"]
+    if not (0 <= storage_share <= 1):
+        errors.append(share_range_errors["storage_share"])
+    if not (0 <= loan_share <= 1):
+        errors.append(share_range_errors["loan_share"])
+    if not (0 <= vip_share <= 1):
+        errors.append(share_range_errors["vip_share"])
+    if not (0 <= short_term_share <= 1):
+        errors.append(share_range_errors["short_term_share"])
+    total_shares = storage_share + loan_share + vip_share + short_term_share
     if total_shares > 1.0 + 1e-6:  # Добавлен небольшой допуск для плавающей точки
         errors.append("Сумма долей типов хранения не должна превышать 100%.")
     if params["average_item_value"] < 0:
@@ -76,15 +211,35 @@ def validate_inputs(params: dict) -> bool:
     return len(errors) == 0
 
 # Функция расчёта дополнительных метрик
-@st.cache_data
 def calculate_additional_metrics(total_income: float, total_expenses: float, profit: float):
     profit_margin = (profit / total_income * 100) if total_income > 0 else 0
     profitability = (profit / total_expenses * 100) if total_expenses > 0 else 0
     return profit_margin, profitability
 
+# Функция расчёта минимальной суммы займа
+def min_loan(daily_fee: float, rate: float, default_p: float, liquidity: float,
+             safety: float, growth: float, horizon: int, extended: bool):
+    """
+    Возвращает (минимальная сумма займа, подпись метрики).
+    При extended учитываются рост аренды, риск невозврата, ликвидность и запас прочности.
+    """
+    if rate <= 0:
+        return 0.0, "Мин. сумма займа (базовый расчёт) (руб.)"  # Без ставки займы не приносят дохода
+    if not extended:
+        return daily_fee / (rate / 100), "Мин. сумма займа (базовый расчёт) (руб.)"
+    average_growth_factor = 1 + growth * (horizon / 2)
+    adjusted_daily_storage_fee = daily_fee * average_growth_factor
+    loan_divisor = (rate / 100) * (1 - default_p) * liquidity
+    return safety * (adjusted_daily_storage_fee / loan_divisor), "Мин. сумма займа (учёт рисков и динамики) (руб.)"
+
+# Сериализация DataFrame в CSV (кэшируется, пока данные не изменились)
+@st.cache_data(show_spinner=False, max_entries=128)
+def _df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    return df.to_csv(index=False).encode("utf-8")
+
 # Функция для генерации ссылки на скачивание результатов
 def generate_download_link(df: pd.DataFrame, filename: str = "results.csv") -> None:
-    csv = df.to_csv(index=False)
+    csv = _df_to_csv_bytes(df)
     st.download_button(
         label="📥 Скачать результаты в CSV",
         data=csv,
@@ -93,7 +248,6 @@ def generate_download_link(df: pd.DataFrame, filename: str = "results.csv") -> N
     )
 
 # Функция расчёта площадей
-@st.cache_data
 def calculate_areas(total_area: float, useful_area_ratio: float, shelves_per_m2: int,
                     storage_share: float, loan_share: float, vip_share: float, short_term_share: float) -> dict:
     """Рассчитывает площади для разных типов хранения исходя из общих параметров."""
@@ -110,25 +264,7 @@ def calculate_areas(total_area: float, useful_area_ratio: float, shelves_per_m2:
         "short_term_area": short_term_area
     }
 
-# Функция расчёта количества вещей
-@st.cache_data
-def calculate_items(storage_area: float, loan_area: float, vip_area: float, short_term_area: float,
-                    storage_items_density: float, loan_items_density: float,
-                    vip_items_density: float, short_term_items_density: float) -> dict:
-    """Рассчитывает количество вещей для каждого типа хранения."""
-    stored_items = storage_area * storage_items_density
-    total_items_loan = loan_area * loan_items_density
-    vip_stored_items = vip_area * vip_items_density
-    short_term_stored_items = short_term_area * short_term_items_density
-    return {
-        "stored_items": stored_items,
-        "total_items_loan": total_items_loan,
-        "vip_stored_items": vip_stored_items,
-        "short_term_stored_items": short_term_stored_items
-    }
-
 # Основная функция расчёта финансов
-@st.cache_data
 def calculate_financials(
     storage_area: float,
     loan_area: float,
@@ -163,54 +299,21 @@ def calculate_financials(
     - Прибыль
     - И др.
     """
-    # Количество вещей
-    stored_items = storage_area * storage_items_density
-    total_items_loan = loan_area * loan_items_density
-    vip_stored_items = vip_area * vip_items_density
-    short_term_stored_items = short_term_area * short_term_items_density
-
-    # Доходы от простого хранения
-    storage_income = storage_area * storage_fee
-
-    # Доходы от займов
-    loan_interest_rate = max(loan_interest_rate, 0)  # Обеспечиваем неотрицательность ставки
-    loan_amount = loan_area * average_item_value * item_evaluation
-    loan_income_month = loan_amount * (loan_interest_rate / 100) * 30
-
-    # Реализация невостребованных товаров
-    realization_items_storage = stored_items * realization_share_storage
-    realization_items_loan = total_items_loan * realization_share_loan
-    realization_items_vip = vip_stored_items * realization_share_vip
-    realization_items_short_term = short_term_stored_items * realization_share_short_term  # Исправлено
-
-    realization_income_storage = realization_items_storage * average_item_value * (item_realization_markup / 100)
-    realization_income_loan = realization_items_loan * average_item_value * (item_realization_markup / 100)
-    realization_income_vip = realization_items_vip * average_item_value * (item_realization_markup / 100)
-    realization_income_short_term = realization_items_short_term * average_item_value * (item_realization_markup / 100)
-
-    realization_income = (realization_income_storage + realization_income_loan +
-                          realization_income_vip + realization_income_short_term)
-
-    # Применение вероятности дефолта к займам
-    loan_income_after_realization = loan_income_month * (1 - realization_share_loan) * (1 - default_probability)
-
-    # VIP доход
-    vip_income = vip_area * (storage_fee + vip_extra_fee)
-
-    # Краткосрочное хранение
-    short_term_income = short_term_area * short_term_daily_rate * 30
-
-    # Общий доход
-    total_income = (storage_income + loan_income_after_realization +
-                    realization_income + vip_income + short_term_income)
-
-    # Расходы
-    rental_expense = total_area * rental_cost_per_m2
-    total_expenses = (rental_expense + salary_expense + miscellaneous_expenses + depreciation_expense)
-
-    # Прибыль
-    profit = total_income - total_expenses
-    daily_storage_fee = storage_fee / 30
+    # Скаляры приводим к float, чтобы Numba использовала одну специализацию ядра;
+    # массивы (сетка значений при поиске BEP) передаём как есть
+    args = [value if isinstance(value, np.ndarray) else float(value) for value in (
+        storage_area, loan_area, vip_area, short_term_area,
+        storage_items_density, loan_items_density, vip_items_density, short_term_items_density,
+        storage_fee, item_evaluation, item_realization_markup, average_item_value,
+        loan_interest_rate, realization_share_storage, realization_share_loan,
+        realization_share_vip, realization_share_short_term, rental_cost_per_m2,
+        total_area, salary_expense, miscellaneous_expenses, depreciation_expense,
+        default_probability, vip_extra_fee, short_term_daily_rate
+    )]
+    (total_income, total_expenses, profit, realization_income, storage_income,
+     loan_income_after_realization, vip_income, short_term_income, rental_expense,
+     salary_expense, miscellaneous_expenses, depreciation_expense,
+     loan_interest_rate, daily_storage_fee) = calc_financials_kernel(*args)
     return {
         "total_income": total_income,
         "total_expenses": total_expenses,
@@ -228,78 +331,129 @@ def calculate_financials(
         "daily_storage_fee": daily_storage_fee
     }
 
-# Функция расчёта BEP с использованием бинарного поиска и расширения диапазона
-def calculate_bep(param_key, base_value, financials_func, **kwargs):
-    """Расчитывает точку безубыточности для заданного параметра с расширением диапазона поиска при необходимости."""
-    financials_required_keys = [
-        "storage_area",
-        "loan_area",
-        "vip_area",
-        "short_term_area",
-        "storage_items_density",
-        "loan_items_density",
-        "vip_items_density",
-        "short_term_items_density",
-        "storage_fee",
-        "item_evaluation",
-        "item_realization_markup",
-        "average_item_value",
-        "loan_interest_rate",
-        "realization_share_storage",
-        "realization_share_loan",
-        "realization_share_vip",
-        "realization_share_short_term",
-        "rental_cost_per_m2",
-        "total_area",
-        "salary_expense",
-        "miscellaneous_expenses",
-        "depreciation_expense",
-        "default_probability",
-        "vip_extra_fee",
-        "short_term_daily_rate"
-    ]
-    
-    def profit_at_param(value):
-        params = kwargs.copy()
-        params[param_key] = value
-        # Фильтруем параметры, передаваемые в calculate_financials
-        relevant_params = {k: v for k, v in params.items() if k in financials_required_keys}
-        recalc_financials = financials_func(**relevant_params)
-        return recalc_financials["profit"]
-
-    # Инициализация границ поиска
-    low_multiplier = 0.5
-    high_multiplier = 1.5
-    max_iterations = 5  # Максимальное количество расширений диапазона
-    multiplier_step = 0.5  # Шаг расширения диапазона
-
-    for attempt in range(max_iterations):
-        low = base_value * low_multiplier
-        high = base_value * high_multiplier
-        profit_low = profit_at_param(low)
-        profit_high = profit_at_param(high)
-
-        # Проверка, лежит ли BEP между low и high
-        if (profit_low > 0 and profit_high > 0) or (profit_low < 0 and profit_high < 0):
-            # Расширяем диапазон
-            low_multiplier -= multiplier_step
-            high_multiplier += multiplier_step
-            continue  # Переходим к следующей итерации
-        else:
-            # Бинарный поиск
-            for _ in range(100):
-                mid = (low + high) / 2
-                profit_mid = profit_at_param(mid)
-                if profit_mid == 0 or (high - low) < 0.01:
-                    return mid
-                if (profit_low < 0 and profit_mid > 0) or (profit_low > 0 and profit_mid < 0):
-                    high = mid
-                    profit_high = profit_mid
-                else:
-                    low = mid
-                    profit_low = profit_mid
-            return (low + high) / 2
-    return None  # Если после всех попыток BEP не найден
+# Функция построения сетки значений параметра для поиска BEP
+def bep_grid(base_value: float) -> np.ndarray:
+    """Возвращает сетку значений параметра вокруг базового значения."""
+    # Границы сетки покрывают весь диапазон, до которого раньше расширялся поиск
+    # (от 0 до 3.5 базового значения); отрицательные тарифы и ставки не имеют смысла
+    low_multiplier = 0.0
+    high_multiplier = 3.5
+    grid_size = 4096  # Количество точек сетки
+    return np.linspace(base_value * low_multiplier, base_value * high_multiplier, grid_size)
+
+# Функция прибыли от одного варьируемого параметра
+def make_profit_func(param_key, **fixed):
+    """Возвращает функцию value -> прибыль при фиксированных остальных параметрах."""
+    # Один словарь аргументов на всё время поиска корня: при каждом вызове меняется
+    # только варьируемый параметр, без копирования остальных (как делал бы partial)
+    local = dict(fixed)
+
+    def profit_func(value):
+        local[param_key] = value
+        return calculate_financials(**local)["profit"]
+    return profit_func
+
+# Функция расчёта прибыли на сетке значений параметра
+def sweep_profit(param_key, grid, **fixed):
+    """Рассчитывает прибыль для всех значений параметра на сетке одним векторным вызовом."""
+    # Все формулы — чистая арифметика, поэтому сетка передаётся в calculate_financials целиком
+    profits = make_profit_func(param_key, **fixed)(grid)
+    return grid, profits
+
+# Функция поиска точки, в которой прибыль меняет знак
+def find_zero_crossing(grid, profits, profit_func=None):
+    """
+    Возвращает значение параметра, при котором прибыль равна 0, или None.
+    Если передана profit_func, корень уточняется методом Брента внутри найденного интервала сетки.
+    """
+    # Ищем первую смену знака прибыли
+    crossings = np.flatnonzero(np.diff(np.sign(profits)))
+    if crossings.size == 0:
+        return None  # BEP не найден в пределах сетки
+    i = crossings[0]
+    low, high = grid[i], grid[i + 1]
+    if profit_func is not None:
+        try:
+            return brentq(profit_func, low, high, maxiter=50)
+        except (ValueError, RuntimeError):
+            pass  # Переходим к линейной интерполяции
+    # Линейная интерполяция корня между соседними точками сетки
+    return low - profits[i] * (high - low) / (profits[i + 1] - profits[i])
+
+# Функция расчёта BEP по сетке значений параметра
+# Результат кэшируется между перезапусками скрипта: повторный поиск с теми же
+# параметрами (например, после действий в других вкладках) не пересчитывает сетку
+@st.cache_data(show_spinner=False, max_entries=128)
+def calculate_bep(param_key, base_value, **kwargs):
+    """
+    Расчитывает точку безубыточности для заданного параметра по сетке его значений.
+    Возвращает (bep, grid, profits) или (None, None, None), если BEP не найден.
+    """
+    # Фиксированные параметры, передаваемые в calculate_financials (без варьируемого)
+    relevant_params = {k: kwargs[k] for k in FINANCIALS_KEYS if k != param_key}
+    grid, profits = sweep_profit(param_key, bep_grid(base_value), **relevant_params)
+    bep = find_zero_crossing(grid, profits, make_profit_func(param_key, **relevant_params))
+    if bep is None:
+        return None, None, None  # Сетка и прибыль не нужны: график не строится
+    return bep, grid, profits
+
+# Общее оформление графиков приложения
+@st.cache_resource
+def _base_layout(template="plotly_white"):
+    """Возвращает словарь оформления, общий для всех графиков (не изменять на месте)."""
+    return dict(
+        template=template,
+        xaxis=dict(showgrid=True),
+        yaxis=dict(showgrid=True),
+    )
+
+# Каркас графика BEP (оформление, трассы, линия BEP) строится один раз на параметр
+@st.cache_resource
+def _bep_fig_skeleton(param_name):
+    fig = go.Figure(
+        go.Scattergl(
+            x=[],
+            y=[],
+            mode='lines',
+            name='Прибыль',
+            showlegend=False
+        )
+    )
+    fig.update_layout(_base_layout())
+    fig.update_layout(
+        title=f"Зависимость прибыли от {param_name}",
+        xaxis_title=param_name,
+        yaxis_title="Прибыль (руб./мес.)"
+    )
+
+    # Вертикальная линия для BEP (положение задаётся при отображении)
+    fig.add_vline(
+        x=0,
+        line_dash="dash",
+        line_color="red",
+        annotation=dict(
+            text="BEP",
+            x=0,
+            y=0,
+            showarrow=True,
+            arrowhead=1,
+            ax=0,
+            ay=-40,
+            font=dict(color="red", size=12)
+        )
+    )
+
+    # Маркер на точке BEP с использованием go.Scatter
+    fig.add_trace(
+        go.Scatter(
+            x=[0],
+            y=[0],
+            mode='markers',
+            name='BEP',
+            marker=dict(color='red', size=10)
+        )
+    )
+    return fig
 
 # Обновлённая функция для отображения BEP с улучшенной визуализацией
 def display_bep(bep_result, param_name, param_values, profits):
@@ -313,111 +467,150 @@ def display_bep(bep_result, param_name, param_values, profits):
             а ниже — убыток.
         """)
 
-        # Создание DataFrame для графика
-        df_bep = pd.DataFrame({
-            "Параметр": param_values,
-            "Прибыль (руб.)": profits
-        })
-
-        # Создание основного графика прибыли
-        fig = px.line(
-            df_bep, 
-            x="Параметр", 
-            y="Прибыль (руб.)",
-            title=f"Зависимость прибыли от {param_name}",
-            labels={"Параметр": param_name, "Прибыль (руб.)": "Прибыль (руб./мес.)"},
-            template="plotly_white"
-        )
+        # Копия кэшированного каркаса: общий объект не изменяется между сессиями,
+        # обновляются только данные кривой, линия и маркер BEP
+        fig = go.Figure(_bep_fig_skeleton(param_name))
+        fig.data[0].x = param_values
+        fig.data[0].y = profits
+        fig.data[1].x = [bep_result]
+        fig.layout.shapes[0].update(x0=bep_result, x1=bep_result)
+        fig.layout.annotations[0].x = bep_result
 
-        # Добавление вертикальной линии для BEP
-        fig.add_vline(
-            x=bep_result, 
-            line_dash="dash", 
-            line_color="red",
-            annotation=dict(
-                text="BEP",
-                x=bep_result,
-                y=0,
-                showarrow=True,
-                arrowhead=1,
-                ax=0,
-                ay=-40,
-                font=dict(color="red", size=12)
-            )
-        )
+        st.plotly_chart(fig, key=f"bep_{param_name}", use_container_width=True)
+        st.info("Красная линия и точка указывают на точку безубыточности для данного параметра.")
 
-        # Добавление маркера на точке BEP с использованием go.Scatter
+# Кэшированные построители графиков: при неизменных данных объект Figure
+# не создаётся заново. Возвращаемые фигуры общие для сессий и не изменяются;
+# число хранимых фигур ограничено, т.к. ключ — сами данные графика
+@st.cache_resource(max_entries=32)
+def _pie_income(labels, values):
+    """Круговая диаграмма структуры доходов (labels и values — кортежи)."""
+    fig = px.pie(names=labels, values=values, title="Структура доходов")
+    fig.update_traces(textposition='inside', textinfo='percent+label')
+    return fig
+
+@st.cache_resource(max_entries=32)
+def _line_projections(df_projections):
+    """Линейный график динамики финансовых показателей по месяцам."""
+    # FigureResampler прореживает ряды длиннее 500 точек (LTTB) перед отправкой в браузер
+    fig = FigureResampler(go.Figure(), default_n_shown_samples=500)
+    for column in ["Доходы (руб.)", "Расходы (руб.)", "Прибыль (руб.)"]:
         fig.add_trace(
-            go.Scatter(
-                x=[bep_result],
-                y=[0],
-                mode='markers',
-                name='BEP',
-                marker=dict(color='red', size=10)
-            )
+            go.Scattergl(name=column, mode='lines+markers'),
+            hf_x=df_projections["Месяц"],
+            hf_y=df_projections[column]
         )
+    fig.update_layout(_base_layout())
+    fig.update_layout(
+        title="Динамика финансовых показателей",
+        xaxis_title="Месяц",
+        yaxis_title="Сумма (руб.)",
+        legend_title_text="Показатель"
+    )
+    return fig
+
+@st.cache_resource(max_entries=32)
+def _bar_projections(df_projections):
+    """Столбчатая диаграмма доходов, расходов и прибыли по месяцам."""
+    # Трассы строятся напрямую через graph_objects, без преобразования данных в длинный формат
+    fig = go.Figure([
+        go.Bar(x=df_projections["Месяц"], y=df_projections[column], name=column)
+        for column in ["Доходы (руб.)", "Расходы (руб.)", "Прибыль (руб.)"]
+    ])
+    fig.update_layout(_base_layout())
+    fig.update_layout(
+        title="Сравнение Доходов, Расходов и Прибыли по Месяцам",
+        xaxis_title="Месяц",
+        yaxis_title="Сумма (руб.)",
+        legend_title_text="Показатель",
+        barmode='group'
+    )
+    return fig
 
-        st.plotly_chart(fig, use_container_width=True)
-        st.info("Красная линия и точка указывают на точку безубыточности для данного параметра.")
+@st.cache_resource(max_entries=32)
+def _hist_profit(storage_types, profits):
+    """Гистограмма прибыли по типам хранения (storage_types и profits — кортежи)."""
+    df_profit = pd.DataFrame({"Тип хранения": storage_types, "Прибыль (руб.)": profits})
+    return px.bar(df_profit, x="Тип хранения", y="Прибыль (руб.)",
+                  title="Распределение Прибыли по Типам Хранения",
+                  labels={"Прибыль (руб.)": "Прибыль (руб.)", "Тип хранения": "Тип хранения"},
+                  text_auto=True)
 
 # Функция для расчёта финансовых показателей во времени
+@st.cache_data(show_spinner=False, max_entries=128)
 def project_financials(params: dict) -> pd.DataFrame:
     """Проектирует финансовые показатели на заданный горизонт прогноза."""
-    months = params["time_horizon"]
-    projections = {
-        "Месяц": [],
-        "Доходы (руб.)": [],
-        "Расходы (руб.)": [],
-        "Прибыль (руб.)": []
-    }
-    cumulative_profit = 0.0
-    current_rental_cost_per_m2 = params["rental_cost_per_m2"]
-
-    for month in range(1, months + 1):
-        # Применение месячного роста аренды
-        if month > 1:
-            current_rental_cost_per_m2 *= (1 + params["monthly_rent_growth"])
-
-        # Расчёт финансов за текущий месяц
-        financials = calculate_financials(
-            storage_area=params["storage_area"],
-            loan_area=params["loan_area"],
-            vip_area=params["vip_area"],
-            short_term_area=params["short_term_area"],
-            storage_items_density=params["storage_items_density"],
-            loan_items_density=params["loan_items_density"],
-            vip_items_density=params["vip_items_density"],
-            short_term_items_density=params["short_term_items_density"],
-            storage_fee=params["storage_fee"],
-            item_evaluation=params["item_evaluation"],
-            item_realization_markup=params["item_realization_markup"],
-            average_item_value=params["average_item_value"],
-            loan_interest_rate=params["loan_interest_rate"],
-            realization_share_storage=params["realization_share_storage"],
-            realization_share_loan=params["realization_share_loan"],
-            realization_share_vip=params["realization_share_vip"],
-            realization_share_short_term=params["realization_share_short_term"],
-            rental_cost_per_m2=current_rental_cost_per_m2,
-            total_area=params["total_area"],
-            salary_expense=params["salary_expense"],
-            miscellaneous_expenses=params["miscellaneous_expenses"],
-            depreciation_expense=params["depreciation_expense"],
-            default_probability=params["default_probability"],  # Передаём вероятность дефолта
-            vip_extra_fee=params["vip_extra_fee"],
-            short_term_daily_rate=params["short_term_daily_rate"]
-        )
+    # От месяца к месяцу меняется только аренда, поэтому доходы и прочие расходы
+    # считаем один раз, а рост аренды применяем к вектору месяцев
+    # Аргументы приводим к float, как в calculate_financials, чтобы ядра Numba
+    # не компилировали отдельную специализацию под целые значения виджетов
+    income = compute_income(*map(float, _INCOME_ARGS(params)))[0]  # Общий доход
+    fixed_expenses = compute_non_rental_expenses(
+        float(params["salary_expense"]), float(params["miscellaneous_expenses"]), float(params["depreciation_expense"])
+    )
 
-        profit = financials["profit"]
-        cumulative_profit += profit
+    n_months = params["time_horizon"]
+    # Номер месяца помещается в int16; денежные столбцы остаются float64 —
+    # в float32 суммы порядка миллионов рублей теряют копейки
+    months = np.arange(1, n_months + 1, dtype=np.int16)
+    # Помесячный расчёт с ростом аренды выполняется скомпилированным ядром
+    incomes, total_expenses, cumulative_profit = project_kernel(
+        float(income),
+        float(fixed_expenses),
+        float(params["total_area"] * params["rental_cost_per_m2"]),
+        float(params["monthly_rent_growth"]),
+        int(n_months)
+    )
 
-        projections["Месяц"].append(month)
-        projections["Доходы (руб.)"].append(financials["total_income"])
-        projections["Расходы (руб.)"].append(financials["total_expenses"])
-        projections["Прибыль (руб.)"].append(cumulative_profit)
-    
-    df_projections = pd.DataFrame(projections)
+    df_projections = pd.DataFrame({
+        "Месяц": months,
+        "Доходы (руб.)": incomes,
+        "Расходы (руб.)": total_expenses,
+        "Прибыль (руб.)": cumulative_profit
+    })
     return df_projections
 
+# Функция выполнения основных расчётов модели
+def run_pipeline(params: dict, extended: bool) -> dict:
+    """
+    Рассчитывает площади и вещи по типам хранения, финансовые показатели, метрики
+    и минимальную сумму займа (extended — учитывать ли расширенные параметры).
+    """
+    # Площади и количество вещей по типам хранения (векторы в порядке STORAGE_TYPES)
+    area_vec = np.array(_AREAS(params), dtype=np.float64)
+    item_vec = area_vec * np.array(_DENSITIES(params), dtype=np.float64)
+
+    # Расчёт финансовых показателей
+    base_financials = calculate_financials(*_FIN_ARGS(params))
+
+    # Расчёт дополнительных метрик
+    profit_margin, profitability = calculate_additional_metrics(
+        total_income=base_financials["total_income"],
+        total_expenses=base_financials["total_expenses"],
+        profit=base_financials["profit"]
+    )
+
+    # Расчёт мин. суммы займа
+    min_loan_amount, loan_label = min_loan(
+        daily_fee=base_financials["daily_storage_fee"],
+        rate=params["loan_interest_rate"],
+        default_p=params["default_probability"],
+        liquidity=params["liquidity_factor"],
+        safety=params["safety_factor"],
+        growth=params["monthly_rent_growth"],
+        horizon=params["time_horizon"],
+        extended=extended
+    )
+    return {
+        "area_vec": area_vec,
+        "item_vec": item_vec,
+        "base_financials": base_financials,
+        "profit_margin": profit_margin,
+        "profitability": profitability,
+        "min_loan_amount": min_loan_amount,
+        "loan_label": loan_label
+    }
+
 # Функция для сохранения сценариев
 def save_scenario(params: dict):
     json_data = json.dumps(params, ensure_ascii=False, indent=4)
@@ -430,15 +623,74 @@ def save_scenario(params: dict):
 
 # Функция для загрузки сценариев
 def load_scenario():
-    uploaded_file = st.file_uploader("📂 Загрузить сценарий", type=["json"])
-    if uploaded_file is not None:
-        try:
-            data = json.load(uploaded_file)
-            st.success("Сценарий загружен успешно!")
-            return data
-        except Exception as e:
-            st.error(f"Ошибка при загрузке сценария: {e}")
-    return None
+    """Выводит загрузчик сценария и результат применения последнего загруженного файла."""
+    # Сам файл применяется в начале скрипта (apply_uploaded_scenario), до создания виджетов
+    st.file_uploader("📂 Загрузить сценарий", type=["json"], key="scenario_file")
+    status = st.session_state.get("_scenario_status")
+    if status is not None:
+        kind, message = status
+        if kind == "success":
+            st.success(message)
+        else:
+            st.error(message)
+
+# Проверка, что значение сценария — конечное число
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+# Функция записи значений сценария в состояние виджетов
+def apply_scenario(data: dict) -> None:
+    """
+    Записывает значения сценария в st.session_state по ключам виджетов, чтобы
+    виджеты показали загруженные значения. Нечисловые и неизвестные значения пропускаются.
+    """
+    for key, (scale, is_int, bounds) in SCENARIO_WIDGETS.items():
+        value = data.get(key)
+        if not _is_number(value):
+            continue
+        widget_value = value * scale
+        if bounds is not None:
+            widget_value = min(max(widget_value, bounds[0]), bounds[1])
+        st.session_state[key] = int(round(widget_value)) if is_int else float(widget_value)
+
+    # Дневной тариф: предустановленный вариант или ручной ввод
+    rate = data.get("short_term_daily_rate")
+    if _is_number(rate):
+        rate_label = f"{rate:g} руб./день/м²"
+        if rate_label in SHORT_TERM_RATE_OPTIONS:
+            st.session_state["short_term_rate_choice"] = rate_label
+        else:
+            st.session_state["short_term_rate_choice"] = SHORT_TERM_RATE_OPTIONS[-1]
+            st.session_state["short_term_daily_rate"] = float(rate)
+
+    # Обновляем доли хранения (и слайдеры долей, которые заданы в процентах)
+    for share_key in ALL_SHARE_KEYS:
+        share = data.get(share_key, 0.0)
+        if _is_number(share):
+            share = min(max(float(share), 0.0), 1.0)
+            st.session_state.shares[share_key] = share
+            st.session_state[share_key] = share * 100
+
+# Функция применения загруженного файла сценария
+def apply_uploaded_scenario() -> None:
+    """Применяет файл из загрузчика сценариев один раз на каждую загрузку."""
+    # Значение загрузчика доступно в session_state с прошлого запуска скрипта
+    uploaded_file = st.session_state.get("scenario_file")
+    if uploaded_file is None:
+        st.session_state.pop("_scenario_file_id", None)
+        st.session_state.pop("_scenario_status", None)
+        return
+    if uploaded_file.file_id == st.session_state.get("_scenario_file_id"):
+        return  # Уже применён: дальше параметры меняются виджетами
+    st.session_state["_scenario_file_id"] = uploaded_file.file_id
+    try:
+        data = json.load(uploaded_file)
+        if not isinstance(data, dict):
+            raise ValueError("ожидается JSON-объект с параметрами")
+        apply_scenario(data)
+        st.session_state["_scenario_status"] = ("success", "Сценарий загружен успешно!")
+    except Exception as e:
+        st.session_state["_scenario_status"] = ("error", f"Ошибка при загрузке сценария: {e}")
 
 # Функция для отображения метрик
 def display_metrics(metrics: dict, col):
@@ -460,23 +712,39 @@ def normalize_shares(share_key: str, new_value: float):
     Нормализует доли хранения, чтобы сумма не превышала 1.0.
     Устанавливает доли отключенных типов хранения в 0.
     """
+    shares = st.session_state.shares
     # Получаем список активных долей (ключи, кроме текущего)
-    active_keys = [k for k in st.session_state.shares.keys() if k != share_key]
+    active_keys = tuple(k for k in ALL_SHARE_KEYS if k != share_key)
     # Сумма долей остальных активных типов
-    total_other = sum([st.session_state.shares[k] for k in active_keys])
+    total_other = shares[active_keys[0]] + shares[active_keys[1]] + shares[active_keys[2]]
     # Новая сумма долей после изменения текущей доли
     remaining = 1.0 - new_value
     if remaining < 0:
         remaining = 0.0
     # Если есть другие активные доли, нормализуем их пропорционально
     if total_other > 0:
+        scale = remaining / total_other
         for k in active_keys:
-            st.session_state.shares[k] = (st.session_state.shares[k] / total_other) * remaining
+            shares[k] = shares[k] * scale
     else:
         for k in active_keys:
-            st.session_state.shares[k] = 0.0
+            shares[k] = 0.0
     # Устанавливаем новую долю
-    st.session_state.shares[share_key] = new_value
+    shares[share_key] = new_value
+
+# Обработчик формы долей хранения
+def apply_submitted_shares(storage_options: tuple):
+    """Нормализует доли, изменённые в форме, и выставляет слайдеры по нормализованным долям."""
+    shares = st.session_state.shares
+    # Нормализуем только доли, изменённые пользователем (в порядке слайдеров):
+    # остальные слайдеры возвращают прежние значения и не должны отменять изменение
+    previous_shares = dict(shares)
+    for share_key in storage_options:
+        new_share = st.session_state[share_key]
+        if not math.isclose(new_share, previous_shares[share_key] * 100, abs_tol=1e-9):
+            normalize_shares(share_key, new_share / 100.0)
+    for share_key in storage_options:
+        st.session_state[share_key] = shares[share_key] * 100
 
 # Основная структура интерфейса
 st.markdown("# Экономическая модель склада 📦")
@@ -497,6 +765,15 @@ st.markdown("""
 """)
 
 # Боковая панель с улучшенной структурой и всплывающими подсказками
+# Значения виджетов по умолчанию (повторно задаются и для виджетов, которые
+# не отображались в прошлом запуске и чьё состояние Streamlit удалил)
+for widget_key, default in WIDGET_DEFAULTS.items():
+    st.session_state.setdefault(widget_key, default)
+
+# Загруженный сценарий записывается в состояние виджетов до их создания,
+# чтобы виджеты показали его значения и оставались редактируемыми
+apply_uploaded_scenario()
+
 with st.sidebar:
     st.markdown("## Ввод параметров")
     
@@ -504,38 +781,38 @@ with st.sidebar:
     with st.sidebar.expander("🏢 Параметры склада", expanded=True):
         total_area = st.number_input(
             "📏 Общая площадь склада (м²)",
-            value=250,
             step=10,
-            help="Введите общую площадь вашего склада в квадратных метрах. Это значение должно быть больше нуля."
+            help="Введите общую площадь вашего склада в квадратных метрах. Это значение должно быть больше нуля.",
+            key="total_area"
         )
         rental_cost_per_m2 = st.number_input(
             "💰 Аренда за 1 м² (руб./мес.)",
-            value=1000,
             step=50,
-            help="Ежемесячная арендная плата за один квадратный метр."
+            help="Ежемесячная арендная плата за один квадратный метр.",
+            key="rental_cost_per_m2"
         )
         useful_area_ratio = st.slider(
             "📐 Доля полезной площади (%)",
             40,
             80,
-            50,
-            5,
-            help="Процент полезной площади склада."
+            step=5,
+            help="Процент полезной площади склада.",
+            key="useful_area_ratio"
         ) / 100.0
 
     # Параметры хранения
     with st.sidebar.expander("📦 Параметры хранения"):
         storage_fee = st.number_input(
             "💳 Тариф простого хранения (руб./м²/мес.)",
-            value=1500,
             step=100,
-            help="Стоимость хранения одного квадратного метра в месяц."
+            help="Стоимость хранения одного квадратного метра в месяц.",
+            key="storage_fee"
         )
         shelves_per_m2 = st.number_input(
             "📚 Количество полок на 1 м²",
-            value=3,
             step=1,
-            help="Количество полок на один квадратный метр полезной площади."
+            help="Количество полок на один квадратный метр полезной площади.",
+            key="shelves_per_m2"
         )
 
         no_storage_for_storage = st.checkbox(
@@ -562,12 +839,16 @@ with st.sidebar:
         # Установка долей в 0 при отключении типа хранения
         if no_storage_for_storage:
             st.session_state.shares['storage_share'] = 0.0
+            st.session_state.pop('storage_share', None)  # Слайдер заново получит долю 0 при включении
         if no_storage_for_loan:
             st.session_state.shares['loan_share'] = 0.0
+            st.session_state.pop('loan_share', None)  # Слайдер заново получит долю 0 при включении
         if no_storage_for_vip:
             st.session_state.shares['vip_share'] = 0.0
+            st.session_state.pop('vip_share', None)  # Слайдер заново получит долю 0 при включении
         if no_storage_for_short_term:
             st.session_state.shares['short_term_share'] = 0.0
+            st.session_state.pop('short_term_share', None)  # Слайдер заново получит долю 0 при включении
 
         st.markdown("### 📊 Распределение площади (%)")
         # Управление долями хранения через session_state
@@ -581,28 +862,39 @@ with st.sidebar:
         if not no_storage_for_short_term:
             storage_options.append("short_term_share")
 
+        # Полезная площадь стеллажей (м²), на которую умножаются доли
+        double_shelf_area = total_area * useful_area_ratio * 2 * shelves_per_m2
+
         total_storages = len(storage_options)
         if total_storages == 0:
             st.warning("🚫 Все типы хранения отключены.")
             remaining_share = 1.0
         else:
+            # Слайдеры долей собраны в форму: пересчёт запускается один раз по кнопке,
+            # а не при каждом движении любого из слайдеров
+            with st.form("shares_form"):
+                for share_key in storage_options:
+                    storage_type = storage_type_mapping.get(share_key, share_key.replace('_', ' ').capitalize())
+                    # Положение слайдера (в процентах) хранится в session_state под ключом доли
+                    st.session_state.setdefault(share_key, st.session_state.shares.get(share_key, 0.0) * 100)
+                    st.slider(
+                        f"{storage_type} (%)",
+                        min_value=0.0,
+                        max_value=100.0,
+                        step=1.0,
+                        key=share_key,
+                        help=f"Доля площади, выделенная под {storage_type.lower()}."
+                    )
+                # Нормализация выполняется в обработчике кнопки — до перезапуска скрипта,
+                # поэтому слайдеры сразу показывают нормализованные доли
+                st.form_submit_button("Обновить доли", on_click=apply_submitted_shares, args=(tuple(storage_options),))
+
             for share_key in storage_options:
                 storage_type = storage_type_mapping.get(share_key, share_key.replace('_', ' ').capitalize())
-                current_share = st.session_state.shares.get(share_key, 0.0) * 100
-                new_share = st.slider(
-                    f"{storage_type} (%)",
-                    min_value=0.0,
-                    max_value=100.0,
-                    value=current_share,
-                    step=1.0,
-                    key=share_key,
-                    help=f"Доля площади, выделенная под {storage_type.lower()}."
-                )
-                # Нормализация долей хранения
-                normalize_shares(share_key, new_share / 100.0)
                 # Расчёт выделенной площади
-                allocated_area = total_area * useful_area_ratio * 2 * shelves_per_m2 * st.session_state.shares[share_key]
-                st.markdown(f"**{storage_type}:** {st.session_state.shares[share_key] * 100:.1f}% ({allocated_area:.2f} м²)")
+                share = st.session_state.shares[share_key]
+                allocated_area = double_shelf_area * share
+                st.markdown(f"**{storage_type}:** {share * 100:.1f}% ({allocated_area:.2f} м²)")
 
             # Вычисление оставшейся доли площади
             remaining_share = 1.0 - sum(st.session_state.shares.values())
@@ -610,7 +902,7 @@ with st.sidebar:
             remaining_share = max(min(remaining_share, 1.0), 0.0)
 
         # Вычисление оставшейся площади в м²
-        remaining_area = total_area * useful_area_ratio * 2 * shelves_per_m2 * remaining_share
+        remaining_area = double_shelf_area * remaining_share
 
         # Отображение прогресс бара с текстовой меткой
         progress_bar = st.progress(remaining_share)
@@ -619,15 +911,16 @@ with st.sidebar:
         st.markdown("### 🕒 Тариф для краткосрочного хранения (руб./день/м²)")
         short_term_rate_choice = st.selectbox(
             "Выберите дневной тариф краткосрочного хранения",
-            ["50 руб./день/м²", "60 руб./день/м²", "100 руб./день/м²", "Другое (ввести вручную)"],
-            help="Выберите один из предустановленных тарифов или введите свой."
+            SHORT_TERM_RATE_OPTIONS,
+            help="Выберите один из предустановленных тарифов или введите свой.",
+            key="short_term_rate_choice"
         )
         if short_term_rate_choice == "Другое (ввести вручную)":
             short_term_daily_rate = st.number_input(
                 "Введите дневной тариф (руб./день/м²)",
-                value=60.0,
                 step=5.0,
-                help="Вручную введите дневной тариф для краткосрочного хранения."
+                help="Вручную введите дневной тариф для краткосрочного хранения.",
+                key="short_term_daily_rate"
             )
         else:
             short_term_daily_rate = float(short_term_rate_choice.split()[0])
@@ -638,54 +931,54 @@ with st.sidebar:
             "🔍 Оценка вещи (%)",
             0,
             100,
-            80,
-            5,
-            help="Процент оценки вещи."
+            step=5,
+            help="Процент оценки вещи.",
+            key="item_evaluation"
         ) / 100.0
         item_realization_markup = st.number_input(
             "📈 Наценка реализации (%)",
-            value=20,
             step=5,
-            help="Процент наценки при реализации товаров."
+            help="Процент наценки при реализации товаров.",
+            key="item_realization_markup"
         )
         average_item_value = st.number_input(
             "💲 Средняя оценка (руб./м²)",
-            value=10000,
             step=500,
-            help="Средняя оценка товара в рублях за квадратный метр."
+            help="Средняя оценка товара в рублях за квадратный метр.",
+            key="average_item_value"
         )
         loan_interest_rate = st.number_input(
             "💳 Ставка займов в день (%)",
-            value=0.317,
             step=0.01,
-            help="Процентная ставка по займам в день."
+            help="Процентная ставка по займам в день.",
+            key="loan_interest_rate"
         )
 
     # Параметры плотности
     with st.sidebar.expander("📦 Параметры плотности"):
         storage_items_density = st.number_input(
             "📦 Простое (вещей/м²)",
-            value=5,
             step=1,
-            help="Количество вещей на один квадратный метр простого склада."
+            help="Количество вещей на один квадратный метр простого склада.",
+            key="storage_items_density"
         )
         loan_items_density = st.number_input(
             "💳 Займы (вещей/м²)",
-            value=5,
             step=1,
-            help="Количество вещей на один квадратный метр склада с займами."
+            help="Количество вещей на один квадратный метр склада с займами.",
+            key="loan_items_density"
         )
         vip_items_density = st.number_input(
             "👑 VIP (вещей/м²)",
-            value=2,
             step=1,
-            help="Количество вещей на один квадратный метр VIP-хранения."
+            help="Количество вещей на один квадратный метр VIP-хранения.",
+            key="vip_items_density"
         )
         short_term_items_density = st.number_input(
             "⏳ Краткосрочное (вещей/м²)",
-            value=4,
             step=1,
-            help="Количество вещей на один квадратный метр краткосрочного хранения."
+            help="Количество вещей на один квадратный метр краткосрочного хранения.",
+            key="short_term_items_density"
         )
 
     # Параметры реализации
@@ -694,54 +987,54 @@ with st.sidebar:
             "📦 Простое (%)",
             0,
             100,
-            50,
-            5,
-            help="Процент товаров для реализации из простого хранения."
+            step=5,
+            help="Процент товаров для реализации из простого хранения.",
+            key="realization_share_storage"
         ) / 100.0
         realization_share_loan = st.slider(
             "💳 Займы (%)",
             0,
             100,
-            50,
-            5,
-            help="Процент товаров для реализации из хранения с займами."
+            step=5,
+            help="Процент товаров для реализации из хранения с займами.",
+            key="realization_share_loan"
         ) / 100.0
         realization_share_vip = st.slider(
             "👑 VIP (%)",
             0,
             100,
-            50,
-            5,
-            help="Процент товаров для реализации из VIP-хранения."
+            step=5,
+            help="Процент товаров для реализации из VIP-хранения.",
+            key="realization_share_vip"
         ) / 100.0
         realization_share_short_term = st.slider(
             "⏳ Краткосрочное (%)",
             0,
             100,
-            50,
-            5,
-            help="Процент товаров для реализации из краткосрочного хранения."
+            step=5,
+            help="Процент товаров для реализации из краткосрочного хранения.",
+            key="realization_share_short_term"
         ) / 100.0
 
     # Финансовые параметры
     with st.sidebar.expander("💼 Финансовые параметры"):
         salary_expense = st.number_input(
             "💼 Зарплата (руб./мес.)",
-            value=240000,
             step=10000,
-            help="Ежемесячные расходы на зарплату."
+            help="Ежемесячные расходы на зарплату.",
+            key="salary_expense"
         )
         miscellaneous_expenses = st.number_input(
             "🧾 Прочие расходы (руб./мес.)",
-            value=50000,
             step=5000,
-            help="Ежемесячные прочие расходы."
+            help="Ежемесячные прочие расходы.",
+            key="miscellaneous_expenses"
         )
         depreciation_expense = st.number_input(
             "📉 Амортизация (руб./мес.)",
-            value=20000,
             step=5000,
-            help="Ежемесячные расходы на амортизацию."
+            help="Ежемесячные расходы на амортизацию.",
+            key="depreciation_expense"
         )
 
     # Расширенные параметры
@@ -757,32 +1050,32 @@ with st.sidebar:
                 "🕒 Горизонт прогноза (мес.)",
                 1,
                 24,
-                6,
-                help="Количество месяцев для прогноза финансовых показателей."
+                help="Количество месяцев для прогноза финансовых показателей.",
+                key="time_horizon"
             )
             monthly_rent_growth = st.number_input(
                 "📈 Месячный рост аренды (%)",
-                value=1.0,
                 step=0.5,
-                help="Процентный рост аренды в месяц."
+                help="Процентный рост аренды в месяц.",
+                key="monthly_rent_growth"
             ) / 100.0
             default_probability = st.number_input(
                 "❌ Вероятность невозврата (%)",
-                value=5.0,
                 step=1.0,
-                help="Процентная вероятность невозврата займов."
+                help="Процентная вероятность невозврата займов.",
+                key="default_probability"
             ) / 100.0
             liquidity_factor = st.number_input(
                 "💧 Ликвидность",
-                value=1.0,
                 step=0.1,
-                help="Коэффициент ликвидности."
+                help="Коэффициент ликвидности.",
+                key="liquidity_factor"
             )
             safety_factor = st.number_input(
                 "🛡️ Коэффициент запаса",
-                value=1.2,
                 step=0.1,
-                help="Коэффициент запаса для расчёта минимальной суммы займа."
+                help="Коэффициент запаса для расчёта минимальной суммы займа.",
+                key="safety_factor"
             )
     else:
         time_horizon = 1
@@ -823,7 +1116,7 @@ params = {
     "loan_items_density": loan_items_density,
     "vip_items_density": vip_items_density,
     "short_term_items_density": short_term_items_density,
-    "vip_extra_fee": 1000.0  # Можно сделать параметром, если необходимо
+    "vip_extra_fee": st.session_state.get("vip_extra_fee", 1000.0)  # Можно сделать параметром, если необходимо
 }
 
 # Расчёт площадей и добавление их в params
@@ -838,89 +1131,55 @@ areas = calculate_areas(
 )
 params.update(areas)  # Добавляем рассчитанные площади в params
 
+# Сохранение и загрузка сценариев после определения params
+with st.sidebar.expander("💾 Сохранение/Загрузка сценариев"):
+    save_scenario(params)
+    load_scenario()
+
 # Валидация входных данных
 inputs_valid = validate_inputs(params)
 
 if inputs_valid:
-    # Расчёт количества вещей
-    items = calculate_items(
-        storage_area=params["storage_area"],
-        loan_area=params["loan_area"],
-        vip_area=params["vip_area"],
-        short_term_area=params["short_term_area"],
-        storage_items_density=params["storage_items_density"],
-        loan_items_density=params["loan_items_density"],
-        vip_items_density=params["vip_items_density"],
-        short_term_items_density=params["short_term_items_density"]
-    )
-
-    # Расчёт финансовых показателей
-    base_financials = calculate_financials(
-        storage_area=params["storage_area"],
-        loan_area=params["loan_area"],
-        vip_area=params["vip_area"],
-        short_term_area=params["short_term_area"],
-        storage_items_density=params["storage_items_density"],
-        loan_items_density=params["loan_items_density"],
-        vip_items_density=params["vip_items_density"],
-        short_term_items_density=params["short_term_items_density"],
-        storage_fee=params["storage_fee"],
-        item_evaluation=params["item_evaluation"],
-        item_realization_markup=params["item_realization_markup"],
-        average_item_value=params["average_item_value"],
-        loan_interest_rate=params["loan_interest_rate"],
-        realization_share_storage=params["realization_share_storage"],
-        realization_share_loan=params["realization_share_loan"],
-        realization_share_vip=params["realization_share_vip"],
-        realization_share_short_term=params["realization_share_short_term"],
-        rental_cost_per_m2=params["rental_cost_per_m2"],
-        total_area=params["total_area"],
-        salary_expense=params["salary_expense"],
-        miscellaneous_expenses=params["miscellaneous_expenses"],
-        depreciation_expense=params["depreciation_expense"],
-        default_probability=params["default_probability"],  # Передаём вероятность дефолта
-        vip_extra_fee=params["vip_extra_fee"],
-        short_term_daily_rate=params["short_term_daily_rate"]
-    )
-
-    # Расчёт дополнительных метрик
-    profit_margin, profitability = calculate_additional_metrics(
-        total_income=base_financials["total_income"],
-        total_expenses=base_financials["total_expenses"],
-        profit=base_financials["profit"]
-    )
+    # Основные расчёты повторяются только при изменении числовых параметров
+    # или переключателя расширенных параметров; иначе результаты берутся из session_state
+    extended = not disable_extended
+    params_hash = hash((extended, tuple(sorted((k, v) for k, v in params.items() if isinstance(v, (int, float))))))
+    if params_hash != st.session_state.get('_last_hash'):
+        st.session_state['_cache'] = run_pipeline(params, extended)
+        st.session_state['_last_hash'] = params_hash
+    pipeline = st.session_state['_cache']
+    area_vec = pipeline["area_vec"]
+    item_vec = pipeline["item_vec"]
+    base_financials = pipeline["base_financials"]
+    profit_margin = pipeline["profit_margin"]
+    profitability = pipeline["profitability"]
+    min_loan_amount = pipeline["min_loan_amount"]
+    loan_label = pipeline["loan_label"]
 
-    # Расчёт мин. суммы займа
-    if not disable_extended and params["loan_interest_rate"] > 0:
-        average_growth_factor = 1 + params["monthly_rent_growth"] * (params["time_horizon"] / 2)
-        adjusted_daily_storage_fee = base_financials["daily_storage_fee"] * average_growth_factor
-        min_loan_amount = params["safety_factor"] * (adjusted_daily_storage_fee / ((params["loan_interest_rate"]/100)*(1 - params["default_probability"])*params["liquidity_factor"]))
-        loan_label = "Мин. сумма займа (учёт рисков и динамики) (руб.)"
-    else:
-        if params["loan_interest_rate"] > 0:
-            min_loan_amount = base_financials["daily_storage_fee"] / (params["loan_interest_rate"] / 100)
-        else:
-            min_loan_amount = 0.0
-        loan_label = "Мин. сумма займа (базовый расчёт) (руб.)"
 
     # Создание вкладок
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Общие результаты", "📈 Прогнозирование", "🔍 Точка безубыточности", "📋 Детализация"])
 
-    with tab1:
+    # Содержимое каждой вкладки — отдельный фрагмент: взаимодействие с виджетом
+    # вкладки (например, выбор параметра BEP) перезапускает только её фрагмент
+    @st.fragment
+    def render_tab1():
         st.header("📊 Общие результаты")
         col1, col2 = st.columns([2, 3])
 
         with col1:
             st.subheader("🔑 Ключевые метрики")
-            metrics = {
-                "📈 Общий доход (руб./мес.)": f"{base_financials['total_income']:,.2f}",
-                "💸 Общие расходы (руб./мес.)": f"{base_financials['total_expenses']:,.2f}",
-                "💰 Прибыль (руб./мес.)": f"{base_financials['profit']:,.2f}",
-                "💳 " + loan_label: f"{min_loan_amount:,.2f}",
-                "🛍️ Доход от реализации (руб.)": f"{base_financials['realization_income']:,.2f}",
-                "📊 Маржа прибыли (%)": f"{profit_margin:,.2f}%",
-                "🔍 Рентабельность (%)": f"{profitability:,.2f}%"
-            }
+            # Денежные метрики форматируются одним проходом, процентные добавляются в конец
+            metric_specs = (
+                ("📈 Общий доход (руб./мес.)", base_financials["total_income"]),
+                ("💸 Общие расходы (руб./мес.)", base_financials["total_expenses"]),
+                ("💰 Прибыль (руб./мес.)", base_financials["profit"]),
+                ("💳 " + loan_label, min_loan_amount),
+                ("🛍️ Доход от реализации (руб.)", base_financials["realization_income"]),
+            )
+            metrics = {label: f"{value:,.2f}" for label, value in metric_specs}
+            metrics["📊 Маржа прибыли (%)"] = f"{profit_margin:,.2f}%"
+            metrics["🔍 Рентабельность (%)"] = f"{profitability:,.2f}%"
             display_metrics(metrics, col1)
 
         with col2:
@@ -932,22 +1191,19 @@ if inputs_valid:
                 "VIP-хранение",
                 "Краткосрочное хранение"
             ]
-            values = [
+            values = np.clip([
                 base_financials["storage_income"],
                 base_financials["loan_income_after_realization"],
                 base_financials["realization_income"],
                 base_financials["vip_income"],
                 base_financials["short_term_income"]
-            ]
-            values = [max(v, 0) for v in values]
-            if sum(values) <= 0:
+            ], 0, None)
+            if values.sum() <= 0:
                 labels = ["Нет данных"]
-                values = [0]
+                values = np.array([0.0])
 
             # Используем Plotly для интерактивной круговой диаграммы
-            fig = px.pie(names=labels, values=values, title="Структура доходов")
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(_pie_income(tuple(labels), tuple(values.tolist())), use_container_width=True)
 
         # Минимальная выручка для BEP
         st.subheader("📈 Безубыточность (BEP) в денежном выражении")
@@ -957,35 +1213,30 @@ if inputs_valid:
             Выше этого порога — вы в прибыли, ниже — в убытке.
         """)
 
-    with tab2:
+    @st.fragment
+    def render_tab2():
         st.header("📈 Прогнозирование")
         if params["time_horizon"] > 1:
             df_projections = project_financials(params)
             st.subheader("📊 Финансовые показатели по месяцам")
-            st.dataframe(df_projections.style.format({"Доходы (руб.)": "{:,.2f}", "Расходы (руб.)": "{:,.2f}", "Прибыль (руб.)": "{:,.2f}"}))
+            # Числа форматируются в строки заранее, без построения Styler
+            df_display = df_projections.assign(**{
+                col: df_projections[col].map("{:,.2f}".format)
+                for col in ["Доходы (руб.)", "Расходы (руб.)", "Прибыль (руб.)"]
+            })
+            st.dataframe(df_display)
             
             st.subheader("📈 Динамика финансовых показателей")
-            # Преобразование данных в длинный формат
-            df_long = df_projections.melt(id_vars="Месяц", value_vars=["Доходы (руб.)", "Расходы (руб.)", "Прибыль (руб.)"],
-                                          var_name="Показатель", value_name="Значение")
-
-            fig = px.line(df_long, x="Месяц", y="Значение", color="Показатель",
-                          title="Динамика финансовых показателей",
-                          labels={"Значение": "Сумма (руб.)"})
-            fig.update_traces(mode='lines+markers')
-            st.plotly_chart(fig, use_container_width=True)
+            st.plotly_chart(_line_projections(df_projections), use_container_width=True)
             
             # Добавляем Столбчатую Диаграмму
             st.subheader("📊 Сравнение Доходов, Расходов и Прибыли по Месяцам")
-            fig_bar = px.bar(df_projections, x="Месяц", y=["Доходы (руб.)", "Расходы (руб.)", "Прибыль (руб.)"],
-                             title="Сравнение Доходов, Расходов и Прибыли по Месяцам",
-                             labels={"value": "Сумма (руб.)", "Месяц": "Месяц"},
-                             barmode='group')
-            st.plotly_chart(fig_bar, use_container_width=True)
+            st.plotly_chart(_bar_projections(df_projections), use_container_width=True)
         else:
             st.info("Для прогнозирования установите горизонт прогноза более 1 месяца.")
 
-    with tab3:
+    @st.fragment
+    def render_tab3():
         st.header("🔍 Точка безубыточности (BEP)")
         st.subheader("Определение BEP для выбранного параметра")
         
@@ -1017,129 +1268,46 @@ if inputs_valid:
             help="Выберите параметр, для которого нужно рассчитать BEP."
         )
         param_key = parameter_options[parameter_choice]
+        assert param_key in FINANCIALS_KEYS, f"unknown BEP key {param_key}"
 
-        # Определение списка необходимых ключей
-        financials_required_keys = [
-            "storage_area",
-            "loan_area",
-            "vip_area",
-            "short_term_area",
-            "storage_items_density",
-            "loan_items_density",
-            "vip_items_density",
-            "short_term_items_density",
-            "storage_fee",
-            "item_evaluation",
-            "item_realization_markup",
-            "average_item_value",
-            "loan_interest_rate",
-            "realization_share_storage",
-            "realization_share_loan",
-            "realization_share_vip",
-            "realization_share_short_term",
-            "rental_cost_per_m2",
-            "total_area",
-            "salary_expense",
-            "miscellaneous_expenses",
-            "depreciation_expense",
-            "default_probability",
-            "vip_extra_fee",
-            "short_term_daily_rate"
-        ]
-
-        # Фильтрация параметров
-        relevant_params = {k: v for k, v in params.items() if k in financials_required_keys}
-
-        # Автоматический расчёт BEP при изменении параметров
-        bep_result = calculate_bep(param_key, base_param_value, calculate_financials, **relevant_params)
-
-        # Генерация диапазона параметров для графика
-        if param_key == "storage_fee":
-            param_values = np.linspace(params["storage_fee"] * 0.5, params["storage_fee"] * 1.5, 100)
-        elif param_key == "loan_interest_rate":
-            param_values = np.linspace(params["loan_interest_rate"] * 0.5, params["loan_interest_rate"] * 1.5, 100)
-        elif param_key == "vip_extra_fee":
-            param_values = np.linspace(500, 1500, 100)
-        else:  # short_term_daily_rate
-            param_values = np.linspace(params["short_term_daily_rate"] * 0.5, params["short_term_daily_rate"] * 1.5, 100)
-
-        # Проверка наличия данных для построения графика
-        try:
-            profits = [
-                calculate_financials(**{**relevant_params, param_key: val})["profit"]
-                for val in param_values
-            ]
-        except KeyError as e:
-            st.error(f"Ошибка при расчёте прибыли: {e}")
-            profits = []
-
-        # Если BEP не найден, расширяем диапазон и пытаемся снова
-        if bep_result is None:
-            st.warning("Начальный диапазон не содержит BEP. Попробуем расширить диапазон поиска.")
-            # Расширяем диапазон на 50%
-            param_values_extended = np.linspace(params[param_key] * 0.3, params[param_key] * 1.7, 200)
-            try:
-                profits_extended = [
-                    calculate_financials(**{**relevant_params, param_key: val})["profit"]
-                    for val in param_values_extended
-                ]
-                # Переопределяем BEP с расширенным диапазоном
-                bep_result_extended = calculate_bep(param_key, base_param_value, calculate_financials, **relevant_params)
-                if bep_result_extended is not None:
-                    st.success(f"Точка безубыточности найдена в расширенном диапазоне: **{bep_result_extended:.2f}**")
-                    # Отображаем график с расширенным диапазоном
-                    display_bep(bep_result_extended, parameter_choice, param_values_extended, profits_extended)
-                else:
-                    st.error("Не удалось найти точку безубыточности даже после расширения диапазона.")
-            except KeyError as e:
-                st.error(f"Ошибка при расчёте прибыли в расширенном диапазоне: {e}")
-        else:
-            # Отображение BEP с первоначальным диапазоном
-            display_bep(bep_result, parameter_choice, param_values, profits)
+        # Параметры calculate_financials: набор ключей фиксирован, поэтому берём их напрямую
+        relevant_params = {k: params[k] for k in FINANCIALS_ARGS}
 
-    with tab4:
+        # Автоматический расчёт BEP при изменении параметров: одни и те же точки сетки
+        # используются и для поиска BEP, и для построения графика
+        bep_result, param_values, profits = calculate_bep(param_key, base_param_value, **relevant_params)
+
+        # Сетка уже охватывает весь диапазон, до которого раньше расширялся поиск,
+        # поэтому повторной попытки не требуется
+        display_bep(bep_result, parameter_choice, param_values, profits)
+
+    @st.fragment
+    def render_tab4():
         st.header("📋 Детализация")
         st.subheader("📦 Общее количество вещей")
-        st.write(f"**Простое хранение:** {int(items['stored_items']):,}")
-        st.write(f"**Хранение с займами:** {int(items['total_items_loan']):,}")
-        st.write(f"**VIP-хранение:** {int(items['vip_stored_items']):,}")
-        st.write(f"**Краткосрочное хранение:** {int(items['short_term_stored_items']):,}")
+        # Один блок Markdown вместо отдельного элемента на каждый тип хранения
+        st.markdown("  \n".join(
+            f"**{storage_type_name}:** {int(item_count):,}"
+            for storage_type_name, item_count in zip(STORAGE_TYPE_NAMES, item_vec)
+        ))
 
         st.subheader("📐 Площади для разных типов хранения (м²)")
-        storage_data = {
-            "Тип хранения": ["Простое хранение", "Хранение с займами", "VIP-хранение", "Краткосрочное хранение"],
-            "Площадь (м²)": [
-                params["storage_area"],
-                params["loan_area"],
-                params["vip_area"],
-                params["short_term_area"]
-            ],
-            "Количество вещей": [
-                items["stored_items"],
-                items["total_items_loan"],
-                items["vip_stored_items"],
-                items["short_term_stored_items"]
-            ],
-        }
-        df_storage = pd.DataFrame(storage_data)
-        st.dataframe(df_storage.style.format({"Площадь (м²)": "{:,.2f}", "Количество вещей": "{:,.0f}"}))
+        df_storage = pd.DataFrame({
+            "Тип хранения": STORAGE_TYPE_NAMES,
+            "Площадь (м²)": area_vec,
+            "Количество вещей": item_vec,
+        })
+        st.dataframe(df_storage.assign(**{
+            "Площадь (м²)": df_storage["Площадь (м²)"].map("{:,.2f}".format),
+            "Количество вещей": df_storage["Количество вещей"].map("{:,.0f}".format)
+        }))
 
         # Добавление Гистограммы Прибыли
         st.subheader("📊 Распределение Прибыли по Типам Хранения")
-        profit_data = {
-            "Тип хранения": ["Простое хранение", "Хранение с займами", "VIP-хранение", "Краткосрочное хранение"],
-            "Прибыль (руб.)": [
-                base_financials["storage_income"] - (params["storage_area"] * params["rental_cost_per_m2"]),
-                base_financials["loan_income_after_realization"] - (params["loan_area"] * params["rental_cost_per_m2"]),
-                base_financials["vip_income"] - (params["vip_area"] * params["rental_cost_per_m2"]),
-                base_financials["short_term_income"] - (params["short_term_area"] * params["rental_cost_per_m2"])
-            ]
-        }
-        df_profit = pd.DataFrame(profit_data)
-        fig_hist = px.bar(df_profit, x="Тип хранения", y="Прибыль (руб.)",
-                          title="Распределение Прибыли по Типам Хранения",
-                          labels={"Прибыль (руб.)": "Прибыль (руб.)", "Тип хранения": "Тип хранения"},
-                          text_auto=True)
+        # Доход каждого типа хранения за вычетом аренды его площади (векторы в порядке STORAGE_TYPES)
+        income_vec = np.array(_TYPE_INCOMES(base_financials), dtype=np.float64)
+        profit_vec = income_vec - area_vec * params["rental_cost_per_m2"]
+        fig_hist = _hist_profit(STORAGE_TYPE_NAMES, tuple(profit_vec.tolist()))
         st.plotly_chart(fig_hist, use_container_width=True)
 
         st.subheader("📥 Скачать результаты")
@@ -1151,7 +1319,7 @@ if inputs_valid:
                 "Маржа прибыли (%)",
                 "Рентабельность (%)",
                 "Доход от реализации",
-                ("Мин. сумма займа (учёт рисков и динамики) (руб.)" if not disable_extended and params["loan_interest_rate"] > 0 else "Мин. сумма займа (базовый расчёт) (руб.)")
+                loan_label
             ],
             "Значение": [
                 base_financials["total_income"],
@@ -1168,35 +1336,14 @@ if inputs_valid:
         if base_financials["loan_interest_rate"] == 0:
             st.warning("⚠️ Внимание: ставка по займам равна 0. Доход от займов будет отсутствовать.")
 
-# Сохранение и загрузка сценариев после определения params
-with st.sidebar.expander("💾 Сохранение/Загрузка сценариев"):
-    save_scenario(params)
-    loaded_params = load_scenario()
-    if loaded_params:
-        # Обновляем параметры только если загруженные данные корректны
-        params_keys = params.keys()
-        for key in loaded_params.keys():
-            if key in params_keys:
-                params[key] = loaded_params[key]
-        # Обновляем доли хранения
-        st.session_state.shares['storage_share'] = loaded_params.get('storage_share', 0.0)
-        st.session_state.shares['loan_share'] = loaded_params.get('loan_share', 0.0)
-        st.session_state.shares['vip_share'] = loaded_params.get('vip_share', 0.0)
-        st.session_state.shares['short_term_share'] = loaded_params.get('short_term_share', 0.0)
-        # Пересчитываем площади после загрузки сценария
-        areas = calculate_areas(
-            total_area=params["total_area"],
-            useful_area_ratio=params["useful_area_ratio"],
-            shelves_per_m2=params["shelves_per_m2"],
-            storage_share=params["storage_share"],
-            loan_share=params["loan_share"],
-            vip_share=params["vip_share"],
-            short_term_share=params["short_term_share"]
-        )
-        params.update(areas)
-
-        # Перезапуск приложения для применения загруженных параметров
-        # st.experimental_rerun()  # Удалено для предотвращения ошибки
+    with tab1:
+        render_tab1()
+    with tab2:
+        render_tab2()
+    with tab3:
+        render_tab3()
+    with tab4:
+        render_tab4()
 
 # Информационное сообщение внизу страницы
 st.info("""
@@ -0,0 +1,169 @@
+"""
+Вычислительные ядра финансовой модели склада, скомпилированные Numba.
+
+Ядра вынесены из app.py в отдельный модуль: Streamlit заново исполняет скрипт
+при каждом взаимодействии, а импортированный модуль остаётся в памяти процесса,
+поэтому скомпилированный код не приходится пересоздавать на каждом перезапуске.
+Все функции — чистая арифметика и принимают как скаляры, так и массивы NumPy
+(например, сетку значений параметра при поиске BEP).
+"""
+import numpy as np
+from numba import njit
+
+
+# Расчёт доходов склада (не зависят от аренды)
+@njit(cache=True)
+def compute_income(
+    storage_area,
+    loan_area,
+    vip_area,
+    short_term_area,
+    storage_items_density,
+    loan_items_density,
+    vip_items_density,
+    short_term_items_density,
+    storage_fee,
+    item_evaluation,
+    item_realization_markup,
+    average_item_value,
+    loan_interest_rate,
+    realization_share_storage,
+    realization_share_loan,
+    realization_share_vip,
+    realization_share_short_term,
+    default_probability,
+    vip_extra_fee,
+    short_term_daily_rate
+):
+    """
+    Рассчитывает доходы от всех видов хранения и реализации.
+    Возвращает кортеж (total_income, realization_income, storage_income,
+    loan_income_after_realization, vip_income, short_term_income, loan_interest_rate).
+    """
+    # Количество вещей
+    stored_items = storage_area * storage_items_density
+    total_items_loan = loan_area * loan_items_density
+    vip_stored_items = vip_area * vip_items_density
+    short_term_stored_items = short_term_area * short_term_items_density
+
+    # Доходы от простого хранения
+    storage_income = storage_area * storage_fee
+
+    # Доходы от займов
+    loan_interest_rate = np.maximum(loan_interest_rate, 0.0)  # Обеспечиваем неотрицательность ставки (работает и для массивов)
+    loan_amount = loan_area * average_item_value * item_evaluation
+    loan_income_month = loan_amount * (loan_interest_rate / 100) * 30
+
+    # Реализация невостребованных товаров
+    realization_items_storage = stored_items * realization_share_storage
+    realization_items_loan = total_items_loan * realization_share_loan
+    realization_items_vip = vip_stored_items * realization_share_vip
+    realization_items_short_term = short_term_stored_items * realization_share_short_term  # Исправлено
+
+    realization_income_storage = realization_items_storage * average_item_value * (item_realization_markup / 100)
+    realization_income_loan = realization_items_loan * average_item_value * (item_realization_markup / 100)
+    realization_income_vip = realization_items_vip * average_item_value * (item_realization_markup / 100)
+    realization_income_short_term = realization_items_short_term * average_item_value * (item_realization_markup / 100)
+
+    realization_income = (realization_income_storage + realization_income_loan +
+                          realization_income_vip + realization_income_short_term)
+
+    # Применение вероятности дефолта к займам
+    loan_income_after_realization = loan_income_month * (1 - realization_share_loan) * (1 - default_probability)
+
+    # VIP доход
+    vip_income = vip_area * (storage_fee + vip_extra_fee)
+
+    # Краткосрочное хранение
+    short_term_income = short_term_area * short_term_daily_rate * 30
+
+    # Общий доход
+    total_income = (storage_income + loan_income_after_realization +
+                    realization_income + vip_income + short_term_income)
+    return (total_income, realization_income, storage_income, loan_income_after_realization,
+            vip_income, short_term_income, loan_interest_rate)
+
+
+# Расчёт постоянных расходов (всё, кроме аренды)
+@njit(cache=True)
+def compute_non_rental_expenses(salary_expense, miscellaneous_expenses, depreciation_expense):
+    """Рассчитывает сумму ежемесячных расходов без учёта аренды."""
+    return salary_expense + miscellaneous_expenses + depreciation_expense
+
+
+# Полный расчёт финансовых показателей
+@njit(cache=True)
+def calc_financials_kernel(
+    storage_area,
+    loan_area,
+    vip_area,
+    short_term_area,
+    storage_items_density,
+    loan_items_density,
+    vip_items_density,
+    short_term_items_density,
+    storage_fee,
+    item_evaluation,
+    item_realization_markup,
+    average_item_value,
+    loan_interest_rate,
+    realization_share_storage,
+    realization_share_loan,
+    realization_share_vip,
+    realization_share_short_term,
+    rental_cost_per_m2,
+    total_area,
+    salary_expense,
+    miscellaneous_expenses,
+    depreciation_expense,
+    default_probability,
+    vip_extra_fee,
+    short_term_daily_rate
+):
+    """
+    Арифметическое ядро calculate_financials. Аргументы передаются позиционно
+    в порядке сигнатуры calculate_financials. Возвращает кортеж
+    (total_income, total_expenses, profit, realization_income, storage_income,
+    loan_income_after_realization, vip_income, short_term_income, rental_expense,
+    salary_expense, miscellaneous_expenses, depreciation_expense,
+    loan_interest_rate, daily_storage_fee).
+    """
+    (total_income, realization_income, storage_income, loan_income_after_realization,
+     vip_income, short_term_income, loan_interest_rate) = compute_income(
+        storage_area, loan_area, vip_area, short_term_area,
+        storage_items_density, loan_items_density, vip_items_density, short_term_items_density,
+        storage_fee, item_evaluation, item_realization_markup, average_item_value,
+        loan_interest_rate, realization_share_storage, realization_share_loan,
+        realization_share_vip, realization_share_short_term, default_probability,
+        vip_extra_fee, short_term_daily_rate
+    )
+
+    # Расходы
+    rental_expense = total_area * rental_cost_per_m2
+    total_expenses = rental_expense + compute_non_rental_expenses(
+        salary_expense, miscellaneous_expenses, depreciation_expense
+    )
+
+    # Прибыль
+    profit = total_income - total_expenses
+    daily_storage_fee = storage_fee / 30
+    return (total_income, total_expenses, profit, realization_income, storage_income,
+            loan_income_after_realization, vip_income, short_term_income, rental_expense,
+            salary_expense, miscellaneous_expenses, depreciation_expense,
+            loan_interest_rate, daily_storage_fee)
+
+
+# Помесячная проекция доходов, расходов и накопленной прибыли
+@njit(cache=True)
+def project_kernel(income, fixed_expenses, base_rent, monthly_rent_growth, time_horizon):
+    """
+    Рассчитывает помесячные доходы, расходы и накопленную прибыль.
+    Аренда растёт на monthly_rent_growth каждый месяц, остальные статьи постоянны.
+    Возвращает кортеж массивов (incomes, expenses, cumulative_profit).
+    """
+    # Коэффициент роста аренды для месяцев 1..time_horizon: (1 + g) ** (месяц - 1)
+    rent_factor = np.power(1.0 + monthly_rent_growth, np.arange(time_horizon))
+    incomes = np.full(time_horizon, income)
+    expenses = fixed_expenses + base_rent * rent_factor
+    cumulative_profit = np.cumsum(incomes - expenses)
+    return incomes, expenses, cumulative_profit